@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from tracshell.importer import read_rows, load_id_map
+
+
+class ImporterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        filename = os.path.join(self.directory, name)
+        fh = open(filename, 'wb')
+        fh.write(content)
+        fh.close()
+        return filename
+
+    def test_csv(self):
+        filename = self.write('tickets.csv',
+                              'summary,priority,\n'
+                              'Caf\xc3\xa9,major,\n'
+                              '"Two, lines\nhere",,\n')
+        self.assertEqual(list(read_rows(filename)),
+                         [{'summary': u'Café', 'priority': u'major'},
+                          {'summary': u'Two, lines\nhere',
+                           'priority': u''}])
+
+    def test_yaml_list(self):
+        filename = self.write('tickets.yaml',
+                              '- summary: One\n  estimate: 3\n'
+                              '- summary: Two\n  keywords:\n')
+        self.assertEqual(list(read_rows(filename)),
+                         [{'summary': u'One', 'estimate': u'3'},
+                          {'summary': u'Two', 'keywords': u''}])
+
+    def test_yaml_documents(self):
+        filename = self.write('tickets.yml',
+                              'summary: One\n---\nsummary: Two\n')
+        self.assertEqual([row['summary'] for row in read_rows(filename)],
+                         [u'One', u'Two'])
+
+    def test_id_map(self):
+        filename = self.write('tickets.csv.ids', '1\t10\n3\t11\n\n')
+        self.assertEqual(load_id_map(filename), {1: 10, 3: 11})
+        self.assertEqual(load_id_map(filename + '.missing'), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,221 @@
+import errno
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+import xmlrpclib as xmlrpc
+
+from tracshell.proxy import BatchScheduler, TracProxy, ValidationError
+from tracshell.wikicache import WikiCache
+
+
+class FakeCall(object):
+    """
+    Doubles each item. Chunks holding a `flaky` item fail unless the
+    item is alone in its chunk, chunks holding a `broken` item always
+    fail.
+    """
+
+    def __init__(self, flaky=(), broken=(), error=None):
+        self.flaky = set(flaky)
+        self.broken = set(broken)
+        self.error = error or xmlrpc.ProtocolError('example.com/xmlrpc',
+                                                   502, 'Bad Gateway', {})
+        self.chunks = []
+        self._lock = threading.Lock()
+
+    def __call__(self, chunk):
+        with self._lock:
+            self.chunks.append(list(chunk))
+        if self.broken.intersection(chunk) or \
+                (len(chunk) > 1 and self.flaky.intersection(chunk)):
+            raise self.error
+        return [item * 2 for item in chunk]
+
+
+def _scheduler(**options):
+    return BatchScheduler(rate=1e6, burst=1000, backoff=0, chunk_size=8,
+                          **options)
+
+
+class BatchSchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.items = range(200)
+        self.expected = [item * 2 for item in self.items]
+
+    def test_map(self):
+        call = FakeCall()
+        self.assertEqual(_scheduler().map(call, self.items, jobs=1),
+                         self.expected)
+
+    def test_failed_chunks_keep_order(self):
+        for jobs in (1, 4):
+            call = FakeCall(flaky=[3, 57, 58, 120, 199])
+            results = _scheduler().map(call, self.items, jobs=jobs)
+            self.assertEqual(results, self.expected)
+            # the failing chunks were split down to the flaky items
+            for item in call.flaky:
+                self.assertTrue([item] in call.chunks)
+
+    def test_raise_errors(self):
+        call = FakeCall(broken=[42])
+        self.assertRaises(xmlrpc.ProtocolError, _scheduler().map,
+                          call, self.items, jobs=4)
+
+    def test_errors_as_results(self):
+        for jobs in (1, 4):
+            call = FakeCall(broken=[42], flaky=[100])
+            results = _scheduler().map(call, self.items, jobs=jobs,
+                                       raise_errors=False)
+            self.assertTrue(results[42] is call.error)
+            self.assertEqual(results[:42] + results[43:],
+                             self.expected[:42] + self.expected[43:])
+
+    def test_writes_not_resent(self):
+        call = FakeCall(broken=[5])
+        results = _scheduler().map(call, range(8), raise_errors=False,
+                                   idempotent=False)
+        self.assertEqual(call.chunks, [range(8)])
+        self.assertEqual(results, [call.error] * 8)
+
+    def test_unsent_writes_retried(self):
+        refused = socket.error(errno.ECONNREFUSED, 'Connection refused')
+        call = FakeCall(broken=[5], error=refused)
+        scheduler = _scheduler(retries=2)
+        results = scheduler.map(call, range(8), raise_errors=False,
+                                idempotent=False)
+        self.assertEqual(call.chunks, [range(8)] * 3)
+        self.assertEqual(results, [refused] * 8)
+
+    def test_auth_errors_not_retried(self):
+        denied = xmlrpc.ProtocolError('example.com/xmlrpc', 401,
+                                      'Unauthorized', {})
+        call = FakeCall(broken=[5], error=denied)
+        self.assertRaises(xmlrpc.ProtocolError, _scheduler().map,
+                          call, range(8))
+        self.assertEqual(call.chunks, [range(8)])
+
+
+class FakeWiki(object):
+    """ A wiki.* namespace holding `pages` of {name: (version, text)} """
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.calls = []
+
+    def getPageInfo(self, name):
+        self.calls.append('getPageInfo')
+        return {'name': name, 'version': self.pages[name][0],
+                'lastModified': xmlrpc.DateTime('20100101T10:00:00')}
+
+    def getPage(self, name, version):
+        self.calls.append('getPage')
+        return self.pages[name][1]
+
+    def getRecentChanges(self, since):
+        self.calls.append('getRecentChanges')
+        self.since = since
+        return [{'name': 'Changed', 'version': self.pages['Changed'][0],
+                 'lastModified': xmlrpc.DateTime('20100102T10:00:00')}]
+
+
+class FakeServer(object):
+
+    def __init__(self, wiki):
+        self.wiki = wiki
+
+
+class WikiCacheSyncTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.wiki = FakeWiki({'Same': (1, u'Same text'),
+                              'Changed': (1, u'Old text')})
+        # only the wiki part of the proxy is used
+        self.trac = TracProxy.__new__(TracProxy)
+        self.trac.proxy = FakeServer(self.wiki)
+        self.trac.wiki_cache = WikiCache(self.directory)
+        self.trac._wiki_confirmed = set()
+        self.trac._wiki_synced = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_empty_cache_not_synced(self):
+        self.assertEqual(self.trac.sync_wiki_cache(), [])
+        self.assertEqual(self.wiki.calls, [])
+
+    def test_sync(self):
+        self.trac.get_wiki_page('Same')
+        self.trac.get_wiki_page('Changed')
+        self.wiki.pages['Changed'] = (2, u'New text')
+        del self.wiki.calls[:]
+        self.trac.sync_wiki_cache()
+        # the sync starts from the first cached page, not from 1970
+        self.assertEqual(str(self.wiki.since), '20100101T10:00:00')
+        self.assertEqual(self.trac.get_wiki_page('Same'), u'Same text')
+        self.assertEqual(self.trac.get_wiki_page('Changed'), u'New text')
+        self.assertEqual(self.wiki.calls, ['getRecentChanges',
+                                           'getPageInfo', 'getPage'])
+
+
+class SummaryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.trac = TracProxy.__new__(TracProxy)
+        self.trac.ticket_meta = {'milestone': ['1.0', '~next', '!old']}
+        self.trac.multicall = self.multicall
+        self.queries = []
+
+    def multicall(self, calls):
+        results = {'status=new&max=0': [1, 2, 3, 4, 5],
+                   'status=new&max=0&milestone=1.0': [1, 2],
+                   'status=new&max=0&milestone=': [3]}
+        self.queries.extend([params[0] for method, params in calls])
+        return [results[params[0]] for method, params in calls]
+
+    def test_operator_values_counted_as_other(self):
+        total, counts = self.trac.summarize_tickets('status=new',
+                                                    'milestone')
+        self.assertEqual(total, 5)
+        self.assertEqual(counts, [('1.0', 2), ('', 1), (None, 2)])
+        self.assertEqual(len(self.queries), 3)
+
+
+class ValidationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.trac = TracProxy.__new__(TracProxy)
+        self.trac._validators = self.trac._compile_validators([
+            {'name': 'priority', 'type': 'select',
+             'options': ['major', 'minor']},
+            {'name': 'approved', 'type': 'checkbox', 'custom': True},
+            {'name': 'summary', 'type': 'text'}])
+
+    def test_valid(self):
+        self.trac.validate_batch([{'priority': 'major', 'approved': '1',
+                                   'summary': 'Anything'},
+                                  {'priority': '', 'unknown': 'x'}])
+
+    def test_invalid(self):
+        try:
+            self.trac.validate_batch([{'priority': 'major'},
+                                      {'priority': 'urgent'},
+                                      {'approved': 2}], [10, 11, 12])
+        except ValidationError, e:
+            message = str(e)
+        else:
+            self.fail("No ValidationError raised")
+        self.assertTrue("#11 priority: urgent ['major', 'minor']" in message)
+        self.assertTrue("#12 approved: 2 ['0', '1']" in message)
+        self.assertFalse("#10" in message)
+
+    def test_single_dict(self):
+        self.assertRaises(ValidationError, self.trac.validate_fields,
+                          {'priority': 'urgent'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+import xmlrpclib as xmlrpc
+from StringIO import StringIO
+
+from tracshell.backends.trac import Ticket
+from tracshell.rpcstream import parse_ticket_multicall
+
+
+def _ticket_data(id):
+    created = xmlrpc.DateTime('20100101T10:00:00')
+    modified = xmlrpc.DateTime('2010010%dT12:30:00' % (id % 9 + 1))
+    return [id, created, modified, {'summary': u'Ticket \xe9 %d' % id,
+                                    'status': 'new',
+                                    'priority': 'major',
+                                    'description': '',
+                                    'keywords': '<b>&amp;</b>'}]
+
+
+def _response(results):
+    """ A system.multicall response body for `results` """
+    return xmlrpc.dumps((results,), methodresponse=True)
+
+
+def _as_tuple(ticket):
+    return (ticket.id, ticket.created, ticket.modified, ticket.get_attrs())
+
+
+class ParseTicketMulticallTestCase(unittest.TestCase):
+
+    def assertMatchesXmlrpclib(self, body):
+        expected = [Ticket(result[0]) for result in xmlrpc.loads(body)[0][0]]
+        parsed = parse_ticket_multicall(StringIO(body), Ticket)
+        self.assertEqual([_as_tuple(t) for t in parsed],
+                         [_as_tuple(t) for t in expected])
+
+    def test_tickets(self):
+        self.assertMatchesXmlrpclib(_response([[_ticket_data(i)]
+                                               for i in range(1, 11)]))
+
+    def test_four_results(self):
+        # the array of results has as many items as a ticket.get result
+        self.assertMatchesXmlrpclib(_response([[_ticket_data(i)]
+                                               for i in range(1, 5)]))
+
+    def test_single_result(self):
+        self.assertMatchesXmlrpclib(_response([[_ticket_data(7)]]))
+
+    def test_empty(self):
+        self.assertEqual(parse_ticket_multicall(StringIO(_response([])),
+                                                Ticket), [])
+
+    def test_fault(self):
+        body = _response([[_ticket_data(1)],
+                          {'faultCode': 404,
+                           'faultString': 'Ticket 2 does not exist.'},
+                          [_ticket_data(3)],
+                          {'faultCode': 500, 'faultString': 'Second'}])
+        try:
+            parse_ticket_multicall(StringIO(body), Ticket)
+        except xmlrpc.Fault, e:
+            self.assertEqual(e.faultCode, 404)
+            self.assertEqual(e.faultString, 'Ticket 2 does not exist.')
+        else:
+            self.fail("No Fault raised")
+
+    def test_response_fault(self):
+        body = xmlrpc.dumps(xmlrpc.Fault(403, 'Forbidden'),
+                            methodresponse=True)
+        self.assertRaises(xmlrpc.Fault, parse_ticket_multicall,
+                          StringIO(body), Ticket)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,222 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
 import unittest
+import xmlrpclib
 
 from tracrpc.tests import rpc_testenv
+from tracshell import shell
+from tracshell.backends.trac import Ticket
 from tracshell.proxy import TracProxy
 from tracshell.shell import TracShell, ValidationError, CallFailed
 
 
 class ShellTestCase(unittest.TestCase):
-    pass
+
+    def test_commands_know_their_method(self):
+        # start_shell prunes the commands the server can't run
+        self.assertEqual(TracShell.do_wiki.trac_method, 'wiki.getPage')
+        self.assertEqual(TracShell.do_fetch.trac_method,
+                         'ticket.getAttachment')
+        self.assertFalse(hasattr(TracShell.do_queue, 'trac_method'))
+
+
+class FakeEditor(object):
+    """ Stands in for subprocess, editing files with `edit` """
+
+    def __init__(self, edit):
+        self.edit = edit
+        self.seen = None
+
+    def call(self, args):
+        fh = open(args[1])
+        self.seen = fh.read().decode('utf-8')
+        fh.close()
+        fh = open(args[1], 'w')
+        fh.write(self.edit(self.seen).encode('utf-8'))
+        fh.close()
+
+
+class EditorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.shell = TracShell(None, 'editor', None)
+        self._subprocess = shell.subprocess
+
+    def tearDown(self):
+        shell.subprocess = self._subprocess
+
+    def edit_with(self, edit):
+        shell.subprocess = FakeEditor(edit)
+        return shell.subprocess
+
+    def test_edit_utf8_bytes(self):
+        editor = self.edit_with(lambda text: text + u"keywords=thé\n")
+        data = self.shell._edit_ticket(["summary=caf\xc3\xa9\n",
+                                        u"reporter=me\n"])
+        self.assertEqual(editor.seen, u"summary=café\nreporter=me\n")
+        self.assertEqual(data, {'summary': u'café', 'reporter': u'me',
+                                'keywords': u'thé'})
+
+    def test_edit_unchanged(self):
+        self.edit_with(lambda text: text)
+        self.assertEqual(self.shell._edit_text("summary=caf\xc3\xa9\n"),
+                         None)
+
+    def test_parse_multiline_values(self):
+        content = u"summary=One\ndescription=First line\n\n" \
+                  u"  indented=line\nkeywords=a b\n"
+        self.assertEqual(self.shell._parse_sections(content),
+                         [(None, {'summary': u'One',
+                                  'description': u'First line\n\n'
+                                                 u'  indented=line',
+                                  'keywords': u'a b'})])
+
+    def test_parse_sections(self):
+        content = u"##### Ticket 3 #####\nsummary=Three\n" \
+                  u"##### Ticket 12 #####\nsummary=Twelve\nstatus=\n"
+        self.assertEqual(self.shell._parse_sections(content),
+                         [(3, {'summary': u'Three'}),
+                          (12, {'summary': u'Twelve', 'status': u''})])
+
+    def test_parse_fields_before_sections(self):
+        content = u"summary=Loose\n##### Ticket 3 #####\nsummary=Three\n"
+        self.assertEqual(self.shell._parse_sections(content),
+                         [(None, {'summary': u'Loose'}),
+                          (3, {'summary': u'Three'})])
+
+    def _tickets(self):
+        return [Ticket([id, None, None, {'summary': u'Ticket %d' % id,
+                                         'status': u'new'}])
+                for id in (1, 2, 3)]
+
+    def test_edit_tickets(self):
+        def edit(text):
+            text = text.replace(u'summary=Ticket 1', u'summary=Changed')
+            text = text.replace(u'comment=%s\nstatus=new\nsummary=Ticket 2'
+                                % shell.DEFAULT_COMMENT,
+                                u'comment=Looked at it\nstatus=new\n'
+                                u'summary=Ticket 2')
+            return text + u"##### Ticket 9 #####\nsummary=Unknown\n"
+        self.edit_with(edit)
+        updates = self.shell._edit_tickets(self._tickets())
+        self.assertEqual([(ticket.id, comment) for ticket, comment in updates],
+                         [(1, ''), (2, u'Looked at it')])
+        self.assertEqual(updates[0][0].get_changes(),
+                         {'summary': u'Changed'})
+        self.assertEqual(updates[1][0].get_changes(), {})
+
+    def test_edit_tickets_aborted(self):
+        self.edit_with(lambda text: text)
+        self.assertEqual(self.shell._edit_tickets(self._tickets()), None)
+
+
+class FakeAttachments(object):
+    """ Serves `data` as the attachment, or fails with `error` """
+
+    def __init__(self, data, error=None):
+        self.data = data
+        self.error = error
+
+    def list_attachments(self, ticket_id):
+        return [['file.txt', '', len(self.data), None, 'me']]
+
+    def fetch_attachment(self, ticket_id, filename, fh, size, progress):
+        fh.write(self.data[:len(self.data) // 2])
+        if self.error is not None:
+            raise self.error
+        fh.write(self.data[len(self.data) // 2:])
+        return len(self.data)
+
+
+class FetchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.dest = os.path.join(self.directory, 'file.txt')
+        fh = open(self.dest, 'w')
+        fh.write('Existing file')
+        fh.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def fetch(self, trac):
+        TracShell(trac, 'editor', None).do_fetch('1 file.txt %s' % self.dest)
+        fh = open(self.dest)
+        try:
+            return fh.read()
+        finally:
+            fh.close()
+
+    def test_fetch(self):
+        self.assertEqual(self.fetch(FakeAttachments('New contents')),
+                         'New contents')
+        self.assertEqual(os.listdir(self.directory), ['file.txt'])
+
+    def test_failed_fetch_keeps_file(self):
+        trac = FakeAttachments('New contents', CallFailed('Broken'))
+        self.assertEqual(self.fetch(trac), 'Existing file')
+        self.assertEqual(os.listdir(self.directory), ['file.txt'])
+
+
+class FakeImportTrac(object):
+    """ Records the tickets it is asked to create """
+
+    methods = {'ticket.getTicketFields': None}
+    ticket_fields = [{'name': 'summary'}, {'name': 'description'},
+                     {'name': 'milestone'}]
+
+    def __init__(self, error=None):
+        self.error = error
+        self.created = []
+
+    def validate_batch(self, field_dicts, keys=None):
+        pass
+
+    def create_tickets(self, tickets, jobs=None, callback=None):
+        for ticket in tickets:
+            if self.error is not None:
+                raise self.error
+            self.created.append(ticket)
+            callback(ticket[0], ticket[0] + 100)
+        return []
+
+
+class ImportTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'tickets.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_import(self, trac, header):
+        fh = open(self.filename, 'w')
+        fh.write('summary,%s\nOne,1.0\nTwo,2.0\n' % header)
+        fh.close()
+        return TracShell(trac, 'editor', None).do_import(self.filename)
+
+    def test_import(self):
+        trac = FakeImportTrac()
+        self.run_import(trac, 'milestone')
+        self.assertEqual([ticket[1] for ticket in trac.created],
+                         [u'One', u'Two'])
+        fh = open(self.filename + '.ids')
+        self.assertEqual(fh.read(), '1\t101\n2\t102\n')
+        fh.close()
+
+    def test_unknown_fields(self):
+        trac = FakeImportTrac()
+        self.assertEqual(self.run_import(trac, 'milstone'), False)
+        self.assertEqual(trac.created, [])
+
+    def test_unexpected_errors(self):
+        trac = FakeImportTrac(xmlrpclib.ResponseError('Bad response'))
+        self.assertEqual(self.run_import(trac, 'milestone'), False)
+
+
+if __name__ == '__main__':
+    unittest.main()
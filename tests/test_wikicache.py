@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import shutil
+import tempfile
+import unittest
+
+from tracshell.wikicache import WikiCache
+
+
+class WikiCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = WikiCache(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_get_put(self):
+        self.cache.put(u'RunBooks/Déploiement', 3, u'Texte étendu')
+        self.assertEqual(self.cache.get(u'RunBooks/Déploiement', 3),
+                         u'Texte étendu')
+        self.assertEqual(self.cache.get(u'RunBooks/Déploiement', 4), None)
+        self.assertEqual(self.cache.get(u'Other', 3), None)
+
+    def test_persistence(self):
+        self.cache.put('WikiStart', 2, u'Welcome', '20100101T10:00:00')
+        cache = WikiCache(self.directory)
+        self.assertEqual(cache.get('WikiStart', 2), u'Welcome')
+        self.assertEqual(cache.last_change, '20100101T10:00:00')
+
+    def test_invalidate(self):
+        self.cache.put('WikiStart', 2, u'Welcome')
+        self.cache.invalidate('WikiStart')
+        self.assertEqual(self.cache.get('WikiStart', 2), None)
+        self.assertEqual(WikiCache(self.directory).versions, {})
+
+    def test_first_put_sets_last_change(self):
+        self.cache.put('Old', 1, u'', '20090101T10:00:00')
+        self.cache.put('Older', 1, u'', '20080101T10:00:00')
+        self.assertEqual(self.cache.last_change, '20090101T10:00:00')
+
+    def test_seen_change(self):
+        self.cache.seen_change('20100102T10:00:00')
+        self.cache.seen_change('20100101T10:00:00')
+        self.assertEqual(self.cache.last_change, '20100102T10:00:00')
+        self.cache.put('WikiStart', 1, u'', '20000101T10:00:00')
+        self.assertEqual(self.cache.last_change, '20100102T10:00:00')
+
+
+if __name__ == '__main__':
+    unittest.main()
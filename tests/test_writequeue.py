@@ -0,0 +1,106 @@
+import errno
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+import xmlrpclib as xmlrpc
+
+from tracshell.writequeue import WriteQueue
+
+
+class FakeTrac(object):
+    """
+    Answers ticket.get with `modified` times and ticket.create or
+    ticket.update with the results from `results`, or with the ticket
+    id when there are none left.
+    """
+
+    def __init__(self, modified=None, results=()):
+        self.modified = modified or {}
+        self.results = list(results)
+        self.submitted = []
+
+    def multicall(self, calls, jobs=None, raise_errors=True,
+                  idempotent=True):
+        if calls and calls[0][0] == 'ticket.get':
+            return [[id, None, self.modified[id], {}]
+                    for method, (id,) in calls]
+        self.submitted.extend(calls)
+        results = []
+        for method, params in calls:
+            if self.results:
+                results.append(self.results.pop(0))
+            else:
+                results.append(params[0])
+        return results
+
+
+class WriteQueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'queue')
+        self.queue = WriteQueue(self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_persistence(self):
+        self.queue.enqueue_create('Summary', 'Text', {'priority': 'major'})
+        self.queue.enqueue_update(3, 'Comment', {'status': 'closed'},
+                                  '20100101T10:00:00')
+        self.assertEqual(WriteQueue(self.filename).pending,
+                         self.queue.pending)
+
+    def test_flush(self):
+        self.queue.enqueue_create('First', '', {})
+        self.queue.enqueue_update(2, 'Comment', {'status': 'closed'})
+        done = self.queue.flush(FakeTrac(), block_size=1)
+        self.assertEqual([op['op'] for op, result in done],
+                         ['create', 'update'])
+        self.assertEqual(len(WriteQueue(self.filename)), 0)
+
+    def test_conflicts_rejected(self):
+        self.queue.enqueue_update(1, 'Stale', {}, '20100101T10:00:00')
+        self.queue.enqueue_update(2, 'Fresh', {}, '20100101T10:00:00')
+        trac = FakeTrac({1: '20100102T10:00:00', 2: '20100101T10:00:00'})
+        done = self.queue.flush(trac)
+        self.assertEqual([op['id'] for op, result in done], [2])
+        self.assertEqual([op['id'] for op in self.queue.rejected], [1])
+        self.assertEqual(len(trac.submitted), 1)
+
+    def test_faults_rejected(self):
+        self.queue.enqueue_create('Bad', '', {})
+        self.queue.flush(FakeTrac(results=[xmlrpc.Fault(1, 'Refused')]))
+        self.assertEqual(self.queue.pending, [])
+        self.assertEqual(self.queue.rejected[0]['error'], "Code 1: Refused")
+
+    def test_unsent_ops_kept(self):
+        refused = socket.error(errno.ECONNREFUSED, 'Connection refused')
+        for summary in ('a', 'b', 'c', 'd'):
+            self.queue.enqueue_create(summary, '', {})
+        trac = FakeTrac(results=[1, 2, refused, refused])
+        done = self.queue.flush(trac, block_size=2)
+        self.assertEqual(len(done), 2)
+        self.assertTrue(self.queue.last_error is refused)
+        self.assertEqual([op['summary'] for op in
+                          WriteQueue(self.filename).pending], ['c', 'd'])
+
+    def test_sent_ops_not_resent(self):
+        # the server may have created the ticket before timing out
+        self.queue.enqueue_create('Slow', '', {})
+        self.queue.flush(FakeTrac(results=[socket.timeout('timed out')]))
+        self.assertEqual(self.queue.pending, [])
+        self.assertEqual(len(self.queue.rejected), 1)
+        self.assertTrue(self.queue.last_error is None)
+
+    def test_clear_rejected(self):
+        self.queue.enqueue_create('Bad', '', {})
+        self.queue.flush(FakeTrac(results=[xmlrpc.Fault(1, 'Refused')]))
+        self.queue.clear_rejected()
+        self.assertEqual(WriteQueue(self.filename).rejected, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -87,3 +87,17 @@ class Ticket(object):
             if original_dict[k] != new_data[k]:
                 diff[k] = new_data[k]
         return diff
+
+    def diff(self, other):
+        """
+        Compares the original data from the server to that of `other`,
+        a more recent copy of the same ticket, and returns a dict of
+        {field: (old value, new value)} for the fields which differ.
+        """
+        old_dict = dict(self.original_data)
+        new_dict = dict(other.original_data)
+        diff = {}
+        for k in set(old_dict.keys()) | set(new_dict.keys()):
+            if old_dict.get(k) != new_dict.get(k):
+                diff[k] = (old_dict.get(k), new_dict.get(k))
+        return diff
@@ -13,6 +13,12 @@ def get_termsize(term):
 def dict_to_tuple(dict):
     return tuple([(k, v) for k,v in dict.iteritems()])
 
+def to_unicode(text):
+    """ Decodes byte strings as UTF-8, unicode is returned as is """
+    if isinstance(text, str):
+        return text.decode('utf-8')
+    return text
+
 def shell_command(cmd_name): 
     """ Return a wrapped function with a `trac_method` attribute set
     to the value of `cmd_name`.
@@ -24,7 +30,7 @@ def shell_command(cmd_name):
     def inner(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            func.trac_method = cmd_name
             return func(*args, **kwargs)
+        wrapper.trac_method = cmd_name
         return wrapper
     return inner
@@ -0,0 +1,64 @@
+import csv
+
+import yaml
+
+
+def _to_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return value.decode('utf-8')
+    if isinstance(value, unicode):
+        return value
+    return unicode(value)
+
+
+def read_rows(filename):
+    """
+    Yields a dict of ticket fields for each row of a file, one row
+    at a time.
+
+    Files ending in .yaml or .yml hold either a list of mappings or
+    one mapping per YAML document. Anything else is read as CSV with
+    the field names on the first line.
+    """
+    if filename.endswith(('.yaml', '.yml')):
+        fh = open(filename)
+        try:
+            for document in yaml.safe_load_all(fh):
+                if isinstance(document, dict):
+                    document = [document]
+                for row in document or []:
+                    yield dict([(k, _to_text(v))
+                                for k, v in row.iteritems()])
+        finally:
+            fh.close()
+    else:
+        fh = open(filename, 'rb')
+        try:
+            for row in csv.DictReader(fh):
+                yield dict([(k, _to_text(v))
+                            for k, v in row.iteritems() if k])
+        finally:
+            fh.close()
+
+
+def load_id_map(filename):
+    """
+    Returns a dict of {row number: ticket id} read from the id
+    mapping file of an earlier import, or an empty dict if there is
+    no such file.
+    """
+    id_map = {}
+    try:
+        fh = open(filename)
+    except IOError:
+        return id_map
+    try:
+        for line in fh:
+            fields = line.split()
+            if len(fields) == 2:
+                id_map[int(fields[0])] = int(fields[1])
+    finally:
+        fh.close()
+    return id_map
@@ -1,15 +1,252 @@
 import os
 import sys
+import time
+import errno
+import base64
+import httplib
+import socket
+import threading
 import xmlrpclib as xmlrpc
 import urllib
 
 from tracshell.backends import trac
 from tracshell.helpers import dict_to_tuple
+from tracshell import rpcstream
 
 class ConnectionFailed(Exception): pass
 class CallFailed(Exception): pass
 class ValidationError(Exception): pass
 
+# a query value starting with one of these is taken for an operator
+# (contains, starts with, ends with, not) and can't be escaped
+QUERY_OPERATORS = ('~', '^', '$', '!')
+
+def _escape_query_value(value):
+    """ Escapes the characters that are special in Trac query values """
+    return value.replace('\\', '\\\\').replace('&', '\\&').replace('|', '\\|')
+
+def _unlimited_query(query):
+    """ Lifts the server's default result limit from `query` """
+    if 'max=' in query:
+        return query
+    return '&'.join([q for q in (query, 'max=0') if q])
+
+# errors after which a batch is split in two and retried
+SPLIT_ERRORS = (xmlrpc.ProtocolError, httplib.HTTPException, socket.timeout)
+# errors after which a batch is retried as is
+RETRY_ERRORS = SPLIT_ERRORS + (socket.error,)
+# errno values meaning the request never reached the server
+NOT_SENT_ERRNOS = set([errno.ECONNREFUSED, errno.EHOSTUNREACH,
+                       errno.ENETUNREACH])
+# HTTP statuses that retrying or splitting a batch won't fix
+AUTH_ERRCODES = set([401, 403])
+# seconds during which the cached pages confirmed by a wiki cache sync
+# are used without asking the server for their version
+WIKI_SYNC_TTL = 60
+
+def _request_not_sent(error):
+    """ Tells whether `error` means the server never got the request """
+    if isinstance(error, socket.gaierror):
+        return True
+    return isinstance(error, socket.error) and \
+        not isinstance(error, socket.timeout) and \
+        error.errno in NOT_SENT_ERRNOS
+
+def _request_error(error):
+    """ Describes a failed write request """
+    if _request_not_sent(error):
+        return "Couldn't reach the server: %s" % error
+    return "Request failed, it may have been applied anyway: %s" % error
+
+class BatchScheduler(object):
+    """
+    Runs batched XML-RPC calls against one server.
+
+    Items are sent in chunks whose size adapts to the measured latency
+    and to failures. Requests are limited by a token bucket and by the
+    number of requests in flight, both shared by every batch sent to
+    the server. Chunks that fail with a network or HTTP error are split
+    in two and retried with exponential backoff.
+    """
+
+    def __init__(self, rate=10.0, burst=10, max_concurrency=4,
+                 target_latency=2.0, chunk_size=50, max_chunk_size=1000,
+                 retries=3, backoff=1.0):
+        """
+        Arguments:
+        - `rate`: the sustained number of requests per second
+        - `burst`: the number of requests that may be sent at once
+                   after an idle period
+        - `max_concurrency`: the maximum number of requests in flight
+        - `target_latency`: the time in seconds a request should take,
+                            chunks grow or shrink towards it
+        - `chunk_size`: the initial number of items per request
+        - `max_chunk_size`: the largest number of items per request
+        - `retries`: how many times a single item is retried
+        - `backoff`: the delay before the first retry, in seconds
+        """
+        self.rate = float(rate)
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.chunk_size = chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.retries = retries
+        self.backoff = backoff
+        self._tokens = float(burst)
+        self._last_refill = time.time()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    def _take_token(self):
+        while True:
+            with self._lock:
+                now = time.time()
+                self._tokens = min(self.burst, self._tokens +
+                                   (now - self._last_refill) * self.rate)
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def _adapt(self, size, latency, failed):
+        with self._lock:
+            if failed:
+                chunk_size = size // 2
+            elif size < self.chunk_size:
+                # a short last chunk says little about the server
+                return
+            else:
+                # move towards the size that takes target_latency,
+                # growing at most twofold at a time
+                ideal = size * self.target_latency / max(latency, 0.001)
+                chunk_size = int(min(ideal, self.chunk_size * 2))
+            self.chunk_size = max(1, min(self.max_chunk_size, chunk_size))
+
+    def _send(self, call, chunk):
+        with self._slots:
+            self._take_token()
+            start = time.time()
+            try:
+                results = call(chunk)
+            except RETRY_ERRORS:
+                self._adapt(len(chunk), time.time() - start, True)
+                raise
+        self._adapt(len(chunk), time.time() - start, False)
+        return results
+
+    def _can_resend(self, error, idempotent):
+        if isinstance(error, xmlrpc.ProtocolError) and \
+                error.errcode in AUTH_ERRCODES:
+            return False
+        # a write may have been applied even though the request failed
+        return idempotent or _request_not_sent(error)
+
+    def _run_chunk(self, call, chunk, raise_errors, idempotent):
+        try:
+            return self._send(call, chunk)
+        except RETRY_ERRORS:
+            error = sys.exc_info()
+        if self._can_resend(error[1], idempotent):
+            if isinstance(error[1], SPLIT_ERRORS) and len(chunk) > 1:
+                half = len(chunk) // 2
+                return self._run_chunk(call, chunk[:half], raise_errors,
+                                       idempotent) + \
+                       self._run_chunk(call, chunk[half:], raise_errors,
+                                       idempotent)
+            for attempt in range(self.retries):
+                time.sleep(self.backoff * (2 ** attempt))
+                try:
+                    return self._send(call, chunk)
+                except RETRY_ERRORS:
+                    error = sys.exc_info()
+                if not self._can_resend(error[1], idempotent):
+                    break
+        if raise_errors:
+            raise error[0], error[1], error[2]
+        return [error[1]] * len(chunk)
+
+    def map(self, call, items, jobs=None, raise_errors=True,
+            idempotent=True):
+        """
+        Calls `call` with successive chunks of `items` and returns the
+        concatenated results.
+
+        Arguments:
+        - `call`: a callable taking a list of items and returning a
+                  list with one result per item. It may be called from
+                  several threads at once.
+        - `items`: the list of items to process
+        - `jobs`: the number of chunks sent at once, by default
+                  `max_concurrency`
+        - `raise_errors`: if False, the items of a chunk that still
+                          fails after all the retries get the error
+                          as their result instead of it being raised
+        - `idempotent`: if False, a failed chunk is only sent again when
+                        the request never reached the server, since
+                        the server may have applied it otherwise
+        """
+        if jobs is None:
+            jobs = self.max_concurrency
+        results = [None] * len(items)
+        state = {'position': 0, 'error': None}
+        state_lock = threading.Lock()
+
+        def next_chunk():
+            with state_lock:
+                start = state['position']
+                if state['error'] is not None or start >= len(items):
+                    return None, None
+                end = start + self.chunk_size
+                state['position'] = end
+                return start, items[start:end]
+
+        def work():
+            while True:
+                start, chunk = next_chunk()
+                if chunk is None:
+                    return
+                try:
+                    chunk_results = self._run_chunk(call, chunk,
+                                                    raise_errors,
+                                                    idempotent)
+                except Exception:
+                    with state_lock:
+                        if state['error'] is None:
+                            state['error'] = sys.exc_info()
+                    return
+                results[start:start + len(chunk)] = chunk_results
+
+        chunks = (len(items) + self.chunk_size - 1) // self.chunk_size
+        if min(jobs, chunks) <= 1:
+            work()
+        else:
+            threads = [threading.Thread(target=work)
+                       for i in range(min(jobs, chunks))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        if state['error'] is not None:
+            error = state['error']
+            raise error[0], error[1], error[2]
+        return results
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+def get_scheduler(site, **options):
+    """
+    Returns the BatchScheduler shared by all the batched calls sent to
+    `site`, creating it with `options` on first use.
+    """
+    with _schedulers_lock:
+        if site not in _schedulers:
+            _schedulers[site] = BatchScheduler(**options)
+        return _schedulers[site]
+
 class XMLRPCBase(object):
     """
     This base class acts as a wrapper around xmlrpclib and handles the
@@ -21,12 +258,14 @@ class XMLRPCBase(object):
     """
 
     def __init__(self, user, passwd, host,
-                 port=80, path='/xmlrpc', secure=False):
+                 port=80, path='/xmlrpc', secure=False,
+                 scheduler_options=None):
         self._user = user
         self._passwd = passwd
         self._host = host
         self._port = port
         self._path = path
+        self._secure = secure
         self._protocol = 'https:' if secure else 'http:'
 
         # TODO: add proper SSL handling
@@ -36,6 +275,11 @@ class XMLRPCBase(object):
                                            self._host,
                                            self._port,
                                            self._path)
+        self.scheduler = get_scheduler("%s:%s%s" % (self._host,
+                                                    self._port,
+                                                    self._path),
+                                       **(scheduler_options or {}))
+        self._local = threading.local()
         try:
             self.proxy = xmlrpc.ServerProxy(self._url)
         except xmlrpc.ProtocolError, e:
@@ -44,14 +288,76 @@ class XMLRPCBase(object):
             # if the connection was successful
             # gather method names and documentation
             method_names = self.proxy.system.listMethods()
-            method_help = list()
-            multicall = xmlrpc.MultiCall(self.proxy)
-            for name in method_names:
-                multicall.system.methodHelp(name)
-            for help in multicall():
-                method_help.append(help)
+            method_help = self.multicall([('system.methodHelp', (name,))
+                                          for name in method_names])
             self.methods = dict(zip(method_names, method_help))
 
+    def _thread_proxy(self):
+        # ServerProxy objects can't be shared between threads
+        proxy = getattr(self._local, 'proxy', None)
+        if proxy is None:
+            proxy = self._local.proxy = xmlrpc.ServerProxy(self._url)
+        return proxy
+
+    def _multicall_chunk(self, calls):
+        multicall = xmlrpc.MultiCall(self._thread_proxy())
+        for method, params in calls:
+            getattr(multicall, method)(*params)
+        results = []
+        for result in multicall().results:
+            if isinstance(result, dict):
+                results.append(xmlrpc.Fault(result['faultCode'],
+                                            result['faultString']))
+            else:
+                results.append(result[0])
+        return results
+
+    def multicall(self, calls, jobs=None, raise_errors=True,
+                  idempotent=True):
+        """
+        Sends a batch of calls with chunked system.multicall requests
+        through the site's BatchScheduler.
+
+        Arguments:
+        - `calls`: a list of (method name, params) tuples
+        - `jobs`: the number of requests sent at once
+        - `raise_errors`: see BatchScheduler.map
+        - `idempotent`: False for calls that change data on the
+                        server, see BatchScheduler.map
+
+        Returns a list with the result of each call. Calls the server
+        refused get an xmlrpclib.Fault instance as their result.
+        """
+        return self.scheduler.map(self._multicall_chunk, calls, jobs,
+                                  raise_errors, idempotent)
+
+    def _open_stream(self, length, chunks):
+        """
+        POSTs an XML-RPC request body given as an iterable of `chunks`
+        totalling `length` bytes and returns the unread HTTP response,
+        so that neither the request nor the response has to be held in
+        memory as a whole.
+        """
+        if self._secure:
+            conn = httplib.HTTPSConnection(self._host, self._port)
+        else:
+            conn = httplib.HTTPConnection(self._host, self._port)
+        auth = base64.b64encode("%s:%s" % (self._user, self._passwd))
+        conn.putrequest('POST', self._path)
+        conn.putheader('User-Agent', xmlrpc.Transport.user_agent)
+        conn.putheader('Content-Type', 'text/xml')
+        conn.putheader('Content-Length', str(length))
+        conn.putheader('Authorization', 'Basic %s' % auth)
+        conn.endheaders()
+        for chunk in chunks:
+            conn.send(chunk)
+        response = conn.getresponse()
+        if response.status != 200:
+            raise xmlrpc.ProtocolError(self._host + self._path,
+                                       response.status, response.reason,
+                                       response.msg)
+        return response
+
 
 class TracProxy(XMLRPCBase):
     """
@@ -64,48 +370,97 @@ class TracProxy(XMLRPCBase):
     backend = trac
 
     def __init__(self, user, passwd, host,
-                 port=80, path='/xmlrpc', secure=False):
+                 port=80, path='/xmlrpc', secure=False, wiki_cache=None,
+                 scheduler_options=None):
         XMLRPCBase.__init__(self, user, passwd, host,
-                            port, path, secure)
+                            port, path, secure, scheduler_options)
+        self.wiki_cache = wiki_cache
+        # pages found up to date by the last sync_wiki_cache
+        self._wiki_confirmed = set()
+        self._wiki_synced = 0
 
+        if 'ticket.getTicketFields' in self.methods:
+            self.ticket_fields = self.proxy.ticket.getTicketFields()
+        else:
+            self.ticket_fields = self._get_legacy_ticket_fields()
+        self.ticket_meta = dict([(field['name'], field['options'])
+                                 for field in self.ticket_fields
+                                 if 'options' in field])
+        self._validators = self._compile_validators(self.ticket_fields)
+
+    def _get_legacy_ticket_fields(self):
+        """
+        Builds a ticket.getTicketFields style schema from the enum
+        getAll() calls for servers which don't provide the former.
+        """
         ticket_components = ['resolution', 'milestone', 'severity',
                              'status', 'version', 'priority',
                              'type', 'component']
-        ticket_component_values = list()
-        multicall = xmlrpc.MultiCall(self.proxy)
-        # TODO: find a way to compress this into an iterator
-        multicall.ticket.resolution.getAll()
-        multicall.ticket.milestone.getAll()
-        multicall.ticket.severity.getAll()
-        multicall.ticket.status.getAll()
-        multicall.ticket.version.getAll()
-        multicall.ticket.priority.getAll()
-        multicall.ticket.type.getAll()
-        multicall.ticket.component.getAll()
-        for resp in multicall():
-            ticket_component_values.append(resp)
-        self.ticket_meta = dict(zip(ticket_components,
-                                    ticket_component_values))
+        results = self.multicall([('ticket.%s.getAll' % component, ())
+                                  for component in ticket_components])
+        return [{'name': name, 'type': 'select', 'options': options}
+                for name, options in zip(ticket_components, results)
+                if not isinstance(options, xmlrpc.Fault)]
+
+    def _compile_validators(self, ticket_fields):
+        """
+        Compiles the ticket schema into a dict of {field: legal values}
+        for every field (custom ones included) that has a fixed set of
+        values. The empty string is always accepted.
+        """
+        validators = {}
+        for field in ticket_fields:
+            if 'options' in field:
+                legal = set(field['options'])
+            elif field.get('type') == 'checkbox':
+                legal = set(['0', '1'])
+            else:
+                continue
+            legal.add('')
+            validators[field['name']] = frozenset(legal)
+        return validators
+
+    def validate_batch(self, field_dicts, keys=None):
+        """
+        Validates a sequence of ticket field dicts in a single pass
+        against the legal values in the ticket schema
+
+        Raises a ValidationError exception listing every invalid value
+        in every dict if it finds any errors. Errors are labelled with
+        the matching item of `keys`, or with the index of the dict.
+        """
+        errors = []
+        validators = self._validators
+        if keys is None:
+            keys = range(len(field_dicts))
+        for index, fields in zip(keys, field_dicts):
+            for k, v in fields.iteritems():
+                legal = validators.get(k)
+                if legal is None:
+                    continue
+                if not isinstance(v, basestring):
+                    v = unicode(v)
+                if v not in legal:
+                    errors.append((index, k, v, sorted(legal - set(['']))))
+        if errors:
+            warn = "The following fields contain invalid values:\n"
+            if len(field_dicts) == 1:
+                err_str = '\n'.join(["%s: %s %r" % err[1:]
+                                     for err in errors])
+            else:
+                err_str = '\n'.join(["#%s %s: %s %r" % err
+                                     for err in errors])
+            raise ValidationError, warn + err_str
 
     def validate_fields(self, fields):
         """
         Validates a dict of ticket fields against the legal values in
-        self.ticket_meta
+        the ticket schema
 
         Raises a ValidationError exception with a descriptive message
         if it finds any errors
         """
-        errors = []
-        for k, v in fields.iteritems():
-            if self.ticket_meta.has_key(k):
-                if fields[k] != '' and \
-                fields[k] not in self.ticket_meta[k]:
-                    errors.append((k, v,
-                                   self.ticket_meta[k]))
-        if len(errors) > 0:
-            warn = "The following fields contain invalid values:\n"
-            err_str = ''.join(["%s: %s %r" % err for err in errors])
-            raise ValidationError, warn + err_str
+        self.validate_batch([fields])
 
     def get_ticket(self, id):
         """ Returns a backends.trac.Ticket object from the server """
@@ -146,6 +501,50 @@ class TracProxy(XMLRPCBase):
         else:
             raise ValueError, "summary and description are required"
 
+    def create_tickets(self, tickets, jobs=None, callback=None):
+        """
+        Creates tickets with batched ticket.create multicalls.
+
+        Failed requests are only sent again when they never reached the
+        server, so that no ticket is created twice.
+
+        Arguments:
+        - `tickets`: a list of (key, summary, description, fields)
+                     tuples, where `key` is any value identifying the
+                     ticket to the caller
+        - `jobs`: the number of multicalls sent concurrently
+        - `callback`: an optional callable called with the key and the
+                      new id of each created ticket, one call at a time
+
+        Returns a list of (key, error message) tuples for the tickets
+        which couldn't be created.
+        """
+        failed = []
+        lock = threading.Lock()
+
+        def create_chunk(chunk):
+            results = self._multicall_chunk(
+                [('ticket.create', (summary, description, fields, False))
+                 for key, summary, description, fields in chunk])
+            # report each chunk as it is done so that callers can
+            # record progress
+            with lock:
+                for ticket, result in zip(chunk, results):
+                    if isinstance(result, xmlrpc.Fault):
+                        failed.append((ticket[0], "Code %s: %s" % (
+                            result.faultCode, result.faultString)))
+                    elif callback is not None:
+                        callback(ticket[0], result)
+            return results
+
+        results = self.scheduler.map(create_chunk, tickets, jobs,
+                                     raise_errors=False, idempotent=False)
+        for ticket, result in zip(tickets, results):
+            if isinstance(result, Exception) and \
+                    not isinstance(result, xmlrpc.Fault):
+                failed.append((ticket[0], _request_error(result)))
+        return failed
+
     def save_ticket(self, ticket, comment='No comment'):
         """ Saves a ticket to the server. """
         fields = ticket.get_attrs()
@@ -160,20 +559,157 @@ class TracProxy(XMLRPCBase):
         else:
             ticket._Ticket__original_data = dict_to_tuple(fields)
 
+    def save_tickets(self, updates):
+        """
+        Saves several tickets to the server with batched ticket.update
+        multicalls.
+
+        Arguments:
+        - `updates`: a list of (ticket, comment) tuples
+
+        Returns a list of (ticket id, error message) tuples for the
+        updates the server refused or which couldn't be sent.
+        """
+        self.validate_batch([ticket.get_changes() for ticket, comment
+                             in updates],
+                            [ticket.id for ticket, comment in updates])
+        results = self.multicall([('ticket.update', (ticket.id, comment,
+                                                     ticket.get_changes()))
+                                  for ticket, comment in updates],
+                                 raise_errors=False, idempotent=False)
+        failed = []
+        for (ticket, comment), result in zip(updates, results):
+            if isinstance(result, xmlrpc.Fault):
+                failed.append((ticket.id, "Code %s: %s" % (
+                    result.faultCode, result.faultString)))
+            elif isinstance(result, Exception):
+                failed.append((ticket.id, _request_error(result)))
+            else:
+                ticket._original_data = dict_to_tuple(ticket.get_attrs())
+        return failed
+
+    def get_tickets(self, ticket_ids):
+        """
+        Returns a list of backends.trac.Ticket objects fetched with a
+        single multicall, parsing the response as it is received
+        """
+        def get_chunk(chunk):
+            calls = [{'methodName': 'ticket.get', 'params': [id]}
+                     for id in chunk]
+            body = xmlrpc.dumps((calls,), 'system.multicall')
+            response = self._open_stream(len(body), [body])
+            return rpcstream.parse_ticket_multicall(response,
+                                                    self.backend.Ticket)
+
+        return self.scheduler.map(get_chunk, list(ticket_ids))
+
     def query_tickets(self, query):
         """ Queries a server for tickets matching the query string """
-        multicall = xmlrpc.MultiCall(self.proxy)
         try:
             ticket_ids = self.proxy.ticket.query(query)
         except xmlrpc.Fault, e:
             raise CallFailed, "Code %s: %s" % (e.faultCode,
                                                e.faultString)
         else:
-            for id in ticket_ids:
-                multicall.ticket.get(id)
-            tickets = [self.backend.Ticket(data)
-                       for data in multicall()]
-            return tickets
+            return self.get_tickets(ticket_ids)
+
+    def _sample_field_values(self, query, field, sample_size):
+        """
+        Returns the distinct values of `field` among the first
+        `sample_size` tickets matching `query`
+        """
+        sample_query = '&'.join([q for q in (query, 'max=%d' % sample_size)
+                                 if q])
+        ticket_ids = self.proxy.ticket.query(sample_query)
+        values = set()
+        for ticket in self.get_tickets(ticket_ids):
+            values.add(getattr(ticket, field, ''))
+        return sorted(values)
+
+    def summarize_tickets(self, query, field, sample_size=200):
+        """
+        Counts the tickets matching a query for each value of `field`
+        with one multicall of id-only ticket.query calls.
+
+        The values come from the ticket schema, or from a sample of
+        the matching tickets for free-form fields such as `owner`.
+
+        Returns a (total, counts) tuple where `counts` is a list of
+        (value, count) tuples. Tickets with values missing from the
+        schema or the sample, or starting with a query operator
+        character, are counted under None.
+        """
+        if field in self.ticket_meta:
+            values = list(self.ticket_meta[field])
+        else:
+            try:
+                values = self._sample_field_values(query, field,
+                                                   sample_size)
+            except xmlrpc.Fault, e:
+                raise CallFailed, "Code %s: %s" % (e.faultCode,
+                                                   e.faultString)
+        if '' not in values:
+            values.append('')
+        values = [value for value in values
+                  if not value.startswith(QUERY_OPERATORS)]
+        base_query = _unlimited_query(query)
+        queries = [base_query] + ['%s&%s=%s' % (base_query, field,
+                                                _escape_query_value(value))
+                                  for value in values]
+        results = []
+        for ids in self.multicall([('ticket.query', (q,)) for q in queries]):
+            if isinstance(ids, xmlrpc.Fault):
+                raise CallFailed, "Code %s: %s" % (ids.faultCode,
+                                                   ids.faultString)
+            results.append(len(ids))
+        total = results[0]
+        counts = zip(values, results[1:])
+        other = total - sum(results[1:])
+        if other > 0:
+            counts.append((None, other))
+        return total, counts
+
+    def watch_query(self, query, tickets, since):
+        """
+        Finds how the result of a query changed since a given time.
+
+        Only the tickets reported by ticket.getRecentChanges are
+        checked against the query and fetched again.
+
+        Arguments:
+        - `query`: a Trac query string
+        - `tickets`: a dict of {id: Ticket} with the known result of
+                     the query, updated in place
+        - `since`: an xmlrpclib.DateTime
+
+        Returns an (added, removed, changed) tuple of lists where
+        `changed` holds (ticket, diff) tuples, see Ticket.diff
+        """
+        try:
+            changed_ids = self.proxy.ticket.getRecentChanges(since)
+            if not changed_ids:
+                return [], [], []
+            id_query = 'id=%s' % ','.join([str(id) for id in changed_ids])
+            matching = self.proxy.ticket.query(
+                '&'.join([_unlimited_query(query), id_query]))
+        except xmlrpc.Fault, e:
+            raise CallFailed, "Code %s: %s" % (e.faultCode,
+                                               e.faultString)
+        added = []
+        changed = []
+        for ticket in self.get_tickets(matching):
+            known = tickets.get(ticket.id)
+            if known is None:
+                added.append(ticket)
+            else:
+                diff = known.diff(ticket)
+                if diff:
+                    changed.append((ticket, diff))
+            tickets[ticket.id] = ticket
+        matching = set(matching)
+        removed = [tickets.pop(id) for id in changed_ids
+                   if id in tickets and id not in matching]
+        return added, removed, changed
 
     def get_changelog(self, ticket):
         """ Queries the server for a tickets' changelog """
@@ -190,9 +726,147 @@ class TracProxy(XMLRPCBase):
 
         Returns a dict of {ticket_id: log}
         """
-        multicall = xmlrpc.MultiCall(self.proxy)
-        for ticket in tickets:
-            multicall.ticket.changeLog(ticket.id)
         ticket_ids = [ticket.id for ticket in tickets]
-        logs = [log for log in multicall()]
+        logs = self.multicall([('ticket.changeLog', (id,))
+                               for id in ticket_ids])
         return dict(zip(ticket_ids, logs))
+
+    def get_wiki_page(self, name):
+        """
+        Returns the text of the latest version of a wiki page.
+
+        Only the page info is requested from the server when the
+        local wiki cache already holds that version, and nothing at all
+        when a sync confirmed the cached version less than
+        WIKI_SYNC_TTL seconds ago.
+        """
+        cache = self.wiki_cache
+        if cache is not None and name in self._wiki_confirmed and \
+                time.time() - self._wiki_synced < WIKI_SYNC_TTL:
+            text = cache.get(name, cache.versions.get(name))
+            if text is not None:
+                return text
+        try:
+            info = self.proxy.wiki.getPageInfo(name)
+        except xmlrpc.Fault, e:
+            raise CallFailed, "Code %s: %s" % (e.faultCode,
+                                               e.faultString)
+        if not info:
+            raise CallFailed, "Page %s not found" % name
+        version = info['version']
+        if self.wiki_cache is not None:
+            text = self.wiki_cache.get(name, version)
+            if text is not None:
+                return text
+        try:
+            text = self.proxy.wiki.getPage(name, version)
+        except xmlrpc.Fault, e:
+            raise CallFailed, "Code %s: %s" % (e.faultCode,
+                                               e.faultString)
+        if self.wiki_cache is not None:
+            self.wiki_cache.put(name, version, text, info['lastModified'])
+        return text
+
+    def put_wiki_page(self, name, text, comment=''):
+        """ Saves a new version of a wiki page to the server """
+        try:
+            self.proxy.wiki.putPage(name, text, {'comment': comment})
+        except xmlrpc.Fault, e:
+            raise CallFailed, "Code %s: %s" % (e.faultCode,
+                                               e.faultString)
+        if self.wiki_cache is not None:
+            self.wiki_cache.invalidate(name)
+            self._wiki_confirmed.discard(name)
+
+    def list_wiki_pages(self):
+        """ Returns a sorted list of all wiki page names """
+        try:
+            return sorted(self.proxy.wiki.getAllPages())
+        except xmlrpc.Fault, e:
+            raise CallFailed, "Code %s: %s" % (e.faultCode,
+                                               e.faultString)
+
+    def sync_wiki_cache(self):
+        """
+        Drops the cached pages that changed on the server since the
+        last sync, using a single wiki.getRecentChanges call. The
+        remaining pages are then served from the cache for
+        WIKI_SYNC_TTL seconds.
+
+        Returns the list of page infos reported as changed.
+        """
+        cache = self.wiki_cache
+        # nothing cached means nothing to drop
+        if cache is None or not cache.versions:
+            return []
+        # the cache records a change time with its first page, so this
+        # is only reached by caches written before it did
+        since = xmlrpc.DateTime(cache.last_change or '19700101T00:00:00')
+        try:
+            changes = self.proxy.wiki.getRecentChanges(since)
+        except xmlrpc.Fault, e:
+            raise CallFailed, "Code %s: %s" % (e.faultCode,
+                                               e.faultString)
+        for info in changes:
+            cached_version = cache.versions.get(info['name'])
+            if cached_version is not None and \
+                    cached_version < info['version']:
+                cache.invalidate(info['name'])
+            cache.seen_change(info['lastModified'])
+        self._wiki_confirmed = set(cache.versions)
+        self._wiki_synced = time.time()
+        return changes
+
+    def list_attachments(self, ticket_id):
+        """
+        Returns a list of [filename, description, size, time, author]
+        lists for the attachments of a ticket
+        """
+        try:
+            return self.proxy.ticket.listAttachments(ticket_id)
+        except xmlrpc.Fault, e:
+            raise CallFailed, "Code %s: %s" % (e.faultCode,
+                                               e.faultString)
+
+    def fetch_attachment(self, ticket_id, filename, fh, size=None,
+                         progress=None):
+        """
+        Downloads a ticket attachment into the file-like object `fh`,
+        decoding it as it is received. Returns the number of bytes
+        written.
+
+        `progress` is an optional callable called with the bytes
+        written so far and `size`.
+        """
+        body = xmlrpc.dumps((ticket_id, filename), 'ticket.getAttachment')
+        parser = rpcstream.BinaryResponseParser(fh, progress, size)
+        try:
+            response = self._open_stream(len(body), [body])
+            return rpcstream.parse_stream(response, parser)
+        except xmlrpc.Fault, e:
+            raise CallFailed, "Code %s: %s" % (e.faultCode,
+                                               e.faultString)
+        except RETRY_ERRORS, e:
+            raise CallFailed, "Request failed: %s" % e
+
+    def attach_file(self, ticket_id, filename, fh, size, description='',
+                    replace=True, progress=None):
+        """
+        Uploads `size` bytes read from the file-like object `fh` as an
+        attachment to a ticket, encoding it as it is sent. Returns the
+        attachment's filename on the server.
+
+        `progress` is an optional callable called with the bytes sent
+        so far and `size`.
+        """
+        length, chunks = rpcstream.binary_call_body(
+            'ticket.putAttachment', (ticket_id, filename, description),
+            fh, size, (replace,), progress)
+        try:
+            response = self._open_stream(length, chunks)
+            return xmlrpc.loads(response.read())[0][0]
+        except xmlrpc.Fault, e:
+            raise CallFailed, "Code %s: %s" % (e.faultCode,
+                                               e.faultString)
+        except RETRY_ERRORS, e:
+            raise CallFailed, _request_error(e)
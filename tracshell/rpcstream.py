@@ -0,0 +1,220 @@
+import base64
+import xmlrpclib as xmlrpc
+from xml.parsers import expat
+try:
+    from xml.etree import cElementTree as ElementTree
+except ImportError:
+    from xml.etree import ElementTree
+
+READ_SIZE = 64 * 1024
+# a multiple of 3 so every chunk but the last encodes without padding
+ENCODE_SIZE = 3 * 16 * 1024
+
+
+def _marshal_params(params):
+    # Marshaller.dumps wraps the values in <params>; strip that so the
+    # values can be spliced around a streamed parameter
+    xml = xmlrpc.Marshaller('utf-8').dumps(params)
+    return xml[len('<params>\n'):-len('</params>\n')]
+
+
+def binary_call_body(method, params_before, fh, size, params_after=(),
+                     progress=None):
+    """
+    Builds the body of an XML-RPC call with a base64 parameter read
+    from `fh`.
+
+    Returns a (length, chunks) tuple where `chunks` is an iterator
+    over the pieces of the body, reading and encoding `fh` on demand.
+
+    Arguments:
+    - `method`: the XML-RPC method name
+    - `params_before`: the parameters preceding the binary one
+    - `fh`: a file-like object with the binary data
+    - `size`: the number of bytes to read from `fh`
+    - `params_after`: the parameters following the binary one
+    - `progress`: an optional callable called with the number of bytes
+                  sent so far and `size`
+    """
+    head = "<?xml version='1.0'?>\n<methodCall>\n" \
+           "<methodName>%s</methodName>\n<params>\n%s" \
+           "<param>\n<value><base64>\n" % (xmlrpc.escape(method),
+                                           _marshal_params(params_before))
+    tail = "\n</base64></value>\n</param>\n%s</params>\n</methodCall>\n" % \
+           _marshal_params(params_after)
+    encoded_size = 4 * ((size + 2) // 3)
+
+    def chunks():
+        yield head
+        sent = 0
+        while sent < size:
+            data = fh.read(min(ENCODE_SIZE, size - sent))
+            if not data:
+                raise IOError("File shrank while it was being sent")
+            sent += len(data)
+            yield base64.b64encode(data)
+            if progress is not None:
+                progress(sent, size)
+        yield tail
+
+    return len(head) + encoded_size + len(tail), chunks()
+
+
+class BinaryResponseParser(object):
+    """
+    Incrementally parses an XML-RPC response whose value is base64
+    data, decoding it into a file as it arrives.
+
+    Faults are buffered whole and raised as xmlrpclib.Fault by `close`.
+    """
+
+    def __init__(self, fh, progress=None, total=None):
+        """
+        Arguments:
+        - `fh`: a file-like object the decoded data is written to
+        - `progress`: an optional callable called with the number of
+                      bytes written so far and `total`
+        - `total`: the expected number of bytes, if known
+        """
+        self._fh = fh
+        self._progress = progress
+        self._total = total
+        # expat hands over character data in small pieces, so it is
+        # collected and decoded a block at a time
+        self._pending = []
+        self._pending_size = 0
+        self._in_base64 = False
+        # raw data is kept until we know the response isn't a fault
+        self._raw = []
+        self._kind = None
+        self.written = 0
+        self._parser = expat.ParserCreate()
+        self._parser.returns_unicode = False
+        self._parser.StartElementHandler = self._start
+        self._parser.EndElementHandler = self._end
+        self._parser.CharacterDataHandler = self._data
+
+    def _start(self, tag, attrs):
+        if tag == 'base64':
+            self._in_base64 = True
+        elif tag in ('params', 'fault') and self._kind is None:
+            self._kind = tag
+
+    def _end(self, tag):
+        if tag == 'base64':
+            self._decode()
+            self._in_base64 = False
+
+    def _data(self, text):
+        if not self._in_base64:
+            return
+        self._pending.append(text)
+        self._pending_size += len(text)
+        if self._pending_size >= READ_SIZE:
+            self._decode()
+
+    def _decode(self):
+        text = ''.join(''.join(self._pending).split())
+        usable = len(text) - len(text) % 4
+        self._pending = [text[usable:]]
+        self._pending_size = len(text) - usable
+        if usable:
+            data = base64.b64decode(text[:usable])
+            self._fh.write(data)
+            self.written += len(data)
+            if self._progress is not None:
+                self._progress(self.written, self._total)
+
+    def feed(self, data):
+        if self._kind != 'params':
+            self._raw.append(data)
+        self._parser.Parse(data, False)
+        if self._kind == 'params':
+            self._raw = []
+
+    def close(self):
+        self._parser.Parse('', True)
+        if self._kind != 'params':
+            # raises the Fault
+            xmlrpc.loads(''.join(self._raw))
+        if self._pending_size:
+            raise xmlrpc.ResponseError("Truncated base64 data")
+        return self.written
+
+
+def parse_stream(response, parser):
+    """ Feeds an HTTP response to `parser` a block at a time """
+    while True:
+        data = response.read(READ_SIZE)
+        if not data:
+            break
+        parser.feed(data)
+    return parser.close()
+
+
+def _unmarshal(value):
+    """ Converts a <value> element the way xmlrpclib would """
+    if len(value) == 0:
+        return value.text or ''
+    typed = value[0]
+    tag = typed.tag
+    text = typed.text
+    if tag == 'string':
+        return text or ''
+    elif tag in ('int', 'i4', 'i8'):
+        return int(text)
+    elif tag == 'dateTime.iso8601':
+        return xmlrpc.DateTime(text.strip())
+    elif tag == 'struct':
+        return dict([(member[0].text, _unmarshal(member[1]))
+                     for member in typed])
+    elif tag == 'array':
+        return [_unmarshal(item) for item in typed[0]]
+    elif tag == 'boolean':
+        return text.strip() == '1'
+    elif tag == 'double':
+        return float(text)
+    elif tag == 'base64':
+        return xmlrpc.Binary(base64.decodestring(text))
+    elif tag == 'nil':
+        return None
+    raise xmlrpc.ResponseError("Unknown XML-RPC type %s" % tag)
+
+
+def parse_ticket_multicall(response, ticket_class):
+    """
+    Parses the response to a system.multicall of ticket.get calls
+    from a file-like object as it is read, creating a ticket object as
+    soon as each result is complete instead of unmarshalling the whole
+    response first.
+
+    Returns the list of tickets or raises the first fault in the
+    response as xmlrpclib.Fault.
+
+    Arguments:
+    - `response`: a file-like object with the response
+    - `ticket_class`: called with the data of each ticket.get result,
+                      typically backends.trac.Ticket
+    """
+    tickets = []
+    fault = None
+    for event, elem in ElementTree.iterparse(response):
+        tag = elem.tag
+        if tag == 'data':
+            # a ticket.get result is [id, created, modified, attributes]
+            if len(elem) == 4 and len(elem[0]) and \
+                    elem[0][0].tag in ('int', 'i4', 'i8'):
+                tickets.append(ticket_class([_unmarshal(value)
+                                             for value in elem]))
+                elem.clear()
+        elif tag == 'struct':
+            if len(elem) == 2 and elem[0][0].text in ('faultCode',
+                                                      'faultString'):
+                if fault is None:
+                    data = dict([(member[0].text, _unmarshal(member[1]))
+                                 for member in elem])
+                    fault = xmlrpc.Fault(data['faultCode'],
+                                         data['faultString'])
+    if fault is not None:
+        raise fault
+    return tickets
@@ -21,7 +21,8 @@ class Site(yaml.YAMLObject):
 
 class Settings(object):
 
-    valid_settings = ['editor', 'default_site', 'aliases', 'pager']
+    valid_settings = ['editor', 'default_site', 'aliases', 'pager',
+                      'write_queue']
 
     def __init__(self, filename='.tracshell'):
         filename = os.path.join(os.path.expanduser('~'), filename)
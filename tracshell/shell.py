@@ -5,11 +5,15 @@ import tempfile
 import xmlrpclib
 import shlex
 import re
+import time
 
 from pydoc import pager
-from tracshell.helpers import get_termsize, shell_command
+from tracshell.helpers import get_termsize, shell_command, to_unicode
 from tracshell.settings import Settings
 from tracshell.proxy import TracProxy, ValidationError, CallFailed
+from tracshell.writequeue import WriteQueue
+from tracshell.wikicache import WikiCache
+from tracshell import importer
 
 VERSION = 0.1
 
@@ -26,7 +30,21 @@ DEFAULT_ALIASES = {
 }
 
 RESERVED_COMMANDS = set(['query', 'view', 'edit', 'create', 'changelog',
-    'quit'])
+    'summary', 'watch', 'import', 'queue', 'flush', 'wiki', 'attachments',
+    'fetch', 'attach', 'quit'])
+
+# bounds of the polling interval of `watch`, in seconds
+WATCH_MIN_INTERVAL = 5
+WATCH_MAX_INTERVAL = 120
+# fields that change with every edit
+WATCH_IGNORED_FIELDS = set(['changetime', 'time', '_ts'])
+
+# editor buffers hold field=val lines, in one section per ticket
+# when several tickets are edited at once
+FIELD_LINE_RE = re.compile(r"(\S*?)=(.*)", re.DOTALL)
+SECTION_MARK = '#####'
+SECTION_LINE_RE = re.compile(r"%s Ticket (\d+)" % SECTION_MARK)
+DEFAULT_COMMENT = "Your comment here"
 
 TERM_SIZE = None
 interactive = True
@@ -50,22 +68,38 @@ def start_shell(settings, args=None):
     else:
       TERM_SIZE = get_termsize(sys.stdout)
      
+    cache_dir = os.path.join(os.path.expanduser('~'), '.tracshell_cache',
+                             settings.site.name, 'wiki')
+    # optional limits on the load batched calls put on the server
+    scheduler_options = dict([(k, getattr(settings.site, k))
+                              for k in ('rate', 'burst', 'max_concurrency')
+                              if hasattr(settings.site, k)])
     trac = TracProxy(settings.site.user,
                      settings.site.passwd,
                      settings.site.host,
                      settings.site.port,
                      settings.site.path,
-                     settings.site.secure)
+                     settings.site.secure,
+                     wiki_cache=WikiCache(cache_dir),
+                     scheduler_options=scheduler_options)
     if settings.editor is None or settings.editor == '':
         print >> sys.stderr, "Warning, no editor set."
-    shell = TracShell(trac, settings.editor, settings.site)
+    write_queue = None
+    if getattr(settings.site, 'write_queue',
+               getattr(settings, 'write_queue', False)):
+        queue_file = os.path.join(os.path.expanduser('~'),
+                                  '.tracshell_queue_%s' % settings.site.name)
+        write_queue = WriteQueue(queue_file)
+    shell = TracShell(trac, settings.editor, settings.site, write_queue)
     server_methods = trac.methods.keys()
     shell_methods = [getattr(shell, x) for x in dir(shell)
         if x.startswith('do_')]
     shell_methods = [x for x in shell_methods if hasattr(x, 'trac_method')]
     for method in shell_methods:
         if method.trac_method not in server_methods:
-            delattr(shell, method.__name__)
+            # commands are looked up on the class, so that's where
+            # they have to go from
+            delattr(TracShell, method.__name__)
     if args:
         line = shell.precmd(args)
         stop = shell.onecmd(line)
@@ -82,16 +116,21 @@ class TracShell(cmd.Cmd):
         http://trac-hacks.org/wiki/XmlRpcPlugin#DownloadandSource
     """
 
-    def __init__(self, trac_interface, editor, site_settings):
+    def __init__(self, trac_interface, editor, site_settings,
+                 write_queue=None):
         """ Initialize the XML-RPC interface to a Trac instance.
 
         Arguments:
         - `trac_interface`: an initialized tracshell.trac.Trac instance
         - `editor`: a path to a valid editor
+        - `write_queue`: an optional tracshell.writequeue.WriteQueue;
+                         if set, edits and new tickets are queued
+                         instead of being sent right away
         """
         self._editor = editor
         self.trac = trac_interface
         self.site_settings = site_settings
+        self.write_queue = write_queue
 
         # set up shell options and shortcut keys
         cmd.Cmd.__init__(self)
@@ -121,39 +160,88 @@ class TracShell(cmd.Cmd):
         Arguments:
         - `initial_lines`: a list of lines to be edited
         """
-        fname = tempfile.mktemp()
-        fh = open(fname, "w")
-        fh.writelines(initial_lines)
-        fh.close()
-        mtime_before = os.stat(fname).st_mtime
-        try:
-            subprocess.call([self._editor, fname])
-        except (AttributeError, OSError):
-            print "No editor set. Can't continue"
-            return None
-        mtime_after = os.stat(fname).st_mtime
-        if not (mtime_after > mtime_before): # no edition took place
-            print "Edition aborted"
+        content = self._edit_text(''.join([to_unicode(line)
+                                           for line in initial_lines]))
+        if content is None:
             return None
+        return self._parse_sections(content)[0][1]
+
+    def _parse_sections(self, content):
+        """
+        Parses the field=val lines of an edited buffer in a single pass.
+
+        A field's value runs until the next line starting with a
+        space-less word followed by a '=', so multi-line values are
+        kept whole. Note: such a line inside a value will be taken for
+        a new field.
+
+        Returns a list of (ticket_id, fields) tuples, one for each
+        ticket section of the buffer. `ticket_id` is None for fields
+        that come before any section header.
+        """
+        sections = [(None, {})]
+        values = {}
+        field = None
+        for line in content.splitlines(True):
+            match = SECTION_LINE_RE.match(line)
+            if match:
+                sections.append((int(match.group(1)), {}))
+                values = {}
+                field = None
+                continue
+            match = FIELD_LINE_RE.match(line)
+            if match:
+                field, value = match.groups()
+                values[field] = [value]
+                sections[-1][1][field] = values[field]
+            elif field is not None:
+                values[field].append(line)
+        for ticket_id, fields in sections:
+            for k, v in fields.items():
+                fields[k] = ''.join(v).strip()
+        if len(sections) > 1 and not sections[0][1]:
+            del sections[0]
+        return sections
+
+    def _edit_text(self, text):
+        """
+        Launches a text editor on `text` and returns the edited text,
+        or None if the file was left unchanged.
+
+        Byte strings are taken to be UTF-8, the text is returned as
+        unicode.
+        """
+        text = to_unicode(text)
+        fd, fname = tempfile.mkstemp(suffix='.txt')
         try:
+            fh = os.fdopen(fd, "w")
+            fh.write(text.encode('utf-8'))
+            fh.close()
+            try:
+                subprocess.call([self._editor, fname])
+            except (AttributeError, OSError):
+                print "No editor set. Can't continue"
+                return None
             fh = open(fname, "r")
-            content = fh.read()
+            new_text = fh.read().decode('utf-8')
             fh.close()
-            # matches a word followed by a '=' with the rest of the content, which ends when the
-            # lookahead reveals either another word+'=' or the end of the string.
-            # Note: This can be fooled by starting a line with a space-less word followed by a '='
-            field_pattern = r"^(\S*?)=(.*?)(?=^\S*=|\Z)"
-            matches = re.findall(field_pattern, content,
-                                 re.DOTALL | re.MULTILINE)
-            data = dict([(f, v.strip()) for f, v in matches])
-            return data
-        except ValueError, e:
-            print "Something went wrong or the file was formatted"
-            print "wrong. Please try submitting the ticket again"
-            print "or file a bug report with the TracShell devs."
-            print "Error: %s" % unicode(e)
+        finally:
+            os.remove(fname)
+        if new_text == text:
+            print "Edition aborted"
             return None
-    
+        return new_text
+
+    def _print_progress(self, done, total):
+        if not interactive:
+            return
+        if total:
+            sys.stderr.write("\r%d/%d bytes (%d%%)" % (done, total,
+                                                       done * 100 / total))
+        else:
+            sys.stderr.write("\r%d bytes" % done)
+        sys.stderr.flush()
+
     def _parse_query_str(self, q):
         """
         Parse a query string
@@ -220,6 +308,101 @@ class TracShell(cmd.Cmd):
             else:
                 print "Query returned no results"
 
+    @shell_command('ticket.query')
+    def do_summary(self, param_str):
+        """
+        Count the tickets matching a query for each value of a field
+
+        trac->> summary `query` by `field`
+
+        Arguments:
+        - `query`: A Trac query string (see `help queries` for more info)
+        - `field`: The ticket field to group by
+        """
+        match = re.match(r"^(.*?)\s*\bby\s+(\S+)\s*$", param_str)
+        if match is None:
+            print "Try `help summary` for more info"
+            return
+        query, field = match.groups()
+        try:
+            total, counts = self.trac.summarize_tickets(
+                '&'.join(shlex.split(query)), field)
+        except CallFailed:
+            print >> sys.stderr, "Bad query specified, please see `help queries`"
+            return
+        output = ["Tickets by %s:" % field]
+        counts.sort(key=lambda count: count[1], reverse=True)
+        for value, count in counts:
+            if count == 0:
+                continue
+            if value is None:
+                value = '(other)'
+            elif value == '':
+                value = '(none)'
+            output.append("%20s: %d" % (value, count))
+        output.append("%20s: %d" % ('total', total))
+        self._print_output(output)
+
+    @shell_command('ticket.getRecentChanges')
+    def do_watch(self, query):
+        """
+        Watch the results of a query and print what changes
+
+        trac->> watch `query`
+
+        The server is polled more often while tickets are changing and
+        less often when they are not. Press Ctrl-C to stop.
+
+        Arguments:
+        - `query`: A Trac query string (see `help queries` for more info)
+        """
+        query = '&'.join(shlex.split(query))
+        since = xmlrpclib.DateTime(time.gmtime())
+        try:
+            tickets = dict([(ticket.id, ticket)
+                            for ticket in self.trac.query_tickets(query)])
+        except CallFailed:
+            print >> sys.stderr, "Bad query specified, please see `help queries`"
+            return
+        print "Watching %d ticket(s), press Ctrl-C to stop" % len(tickets)
+        interval = WATCH_MIN_INTERVAL
+        try:
+            while True:
+                time.sleep(interval)
+                # overlap polls by a second as the server only
+                # compares whole seconds
+                now = xmlrpclib.DateTime(time.gmtime(time.time() - 1))
+                try:
+                    added, removed, changed = self.trac.watch_query(
+                        query, tickets, since)
+                except Exception, e:
+                    print >> sys.stderr, "Polling failed: %s" % e
+                    interval = WATCH_MAX_INTERVAL
+                    continue
+                since = now
+                for ticket in added:
+                    print "+ %5s: [%s] %s" % (ticket.id,
+                                              ticket.status.center(8),
+                                              ticket.summary)
+                for ticket in removed:
+                    print "- %5s: [%s] %s" % (ticket.id,
+                                              ticket.status.center(8),
+                                              ticket.summary)
+                for ticket, diff in changed:
+                    fields = [k for k in sorted(diff.keys())
+                              if k not in WATCH_IGNORED_FIELDS]
+                    if not fields:
+                        continue
+                    print "~ %5s: %s" % (ticket.id, ticket.summary)
+                    for k in fields:
+                        print "%15s: %r -> %r" % (k, diff[k][0], diff[k][1])
+                if added or removed or changed:
+                    interval = max(WATCH_MIN_INTERVAL, interval / 2)
+                else:
+                    interval = min(WATCH_MAX_INTERVAL, interval * 1.5)
+        except KeyboardInterrupt:
+            print
+
     @shell_command('ticket.get')
     def do_view(self, ticket_id):
         """
@@ -306,6 +489,17 @@ class TracShell(cmd.Cmd):
             data = self._edit_ticket(template_lines)
             if data is None:
                 return False
+            if self.write_queue is not None:
+                try:
+                    self.trac.validate_fields(data)
+                except ValidationError, e:
+                    print e
+                    return False
+                self.write_queue.enqueue_create(data.pop("summary"),
+                                                data.pop("description"),
+                                                data)
+                print "Queued new ticket: %s" % param_str
+                return
             try:
                 id = self.trac.create_ticket(data.pop("summary"),
                                              data.pop("description"),
@@ -325,60 +519,473 @@ class TracShell(cmd.Cmd):
             print "Try `help create` for more info"
             pass
 
+    def _edit_tickets(self, tickets):
+        """
+        Launches a text editor with a section for each ticket and
+        returns a list of (ticket, comment) tuples for the tickets
+        that were changed or commented, with the changes applied. None
+        is returned if no edition took place.
+        """
+        lines = []
+        originals = {}
+        for ticket in tickets:
+            data = dict([(k, v) for k, v in ticket.get_attrs().iteritems()
+                         if isinstance(v, basestring)])
+            originals[ticket.id] = data
+            lines.append("%s Ticket %s %s\n" % (SECTION_MARK, ticket.id,
+                                                SECTION_MARK))
+            lines.append("comment=%s\n" % DEFAULT_COMMENT)
+            lines.extend(['%s=%s\n' % (k, v.rstrip())
+                          for k, v in sorted(data.iteritems())])
+        content = self._edit_text(''.join(lines))
+        if content is None:
+            return None
+        tickets = dict([(ticket.id, ticket) for ticket in tickets])
+        updates = []
+        for ticket_id, data in self._parse_sections(content):
+            if ticket_id not in tickets:
+                print "Ignoring section for unknown ticket %s" % ticket_id
+                continue
+            ticket = tickets[ticket_id]
+            comment = data.pop('comment', '')
+            if comment == DEFAULT_COMMENT:
+                comment = ''
+            # submit the difference between what went into the editor
+            # and what came out
+            orig_data = originals[ticket_id]
+            changes = [(k, v) for k, v in data.iteritems()
+                       if k not in orig_data or v != orig_data[k].strip()]
+            if not changes and not comment:
+                continue
+            for k, v in changes:
+                setattr(ticket, k, v)
+            updates.append((ticket, comment))
+        return updates
+
     @shell_command('ticket.update')
     def do_edit(self, param_str):
         """
-        Edit a ticket in Trac
+        Edit one or more tickets in Trac
 
-        trac->> edit `ticket_id` field1=value1 field2=value2
+        trac->> edit `ticket_ids` field1=value1 field2=value2
+        trac->> edit `ticket_ids`
+        trac->> edit `query`
 
-        This feature is still under development.
-        Please report any bugs you find.
+        Without field changes, an editor is opened with a section for
+        each ticket. All changes are submitted together.
+
+        When the write queue is enabled, changes given on the command
+        line are queued without fetching the tickets, so they aren't
+        checked for conflicting changes made on the server meanwhile.
 
         Shortcut: e
         
         Arguments:
-        - `ticket_id`: the id of the ticket to edit
+        - `ticket_ids`: the id of the ticket to edit or a comma
+                        separated list of ids
+        - `query`: A Trac query string (see `help queries` for more info)
         """
-        
         try:
-            ticket_id, changes = param_str.split(' ', 1)
+            spec, changes = param_str.split(' ', 1)
         except ValueError: # No changes specified
-            ticket_id = param_str
+            spec = param_str
             changes = None
         try:
-            ticket = self.trac.get_ticket(int(ticket_id))
-        except ValueError:
-            print "Invalid ticket id specified."
+            ticket_ids = [int(id) for id in spec.split(',')]
+        except ValueError: # the whole line is a query
+            ticket_ids = None
+            changes = None
+        if changes is not None and self.write_queue is not None:
+            # queue inline changes without asking the server
+            data = self._parse_query_str(changes)
+            comment = data.pop('comment', '')
+            try:
+                self.trac.validate_fields(data)
+            except ValidationError, e:
+                print e
+                return False
+            for ticket_id in ticket_ids:
+                self.write_queue.enqueue_update(ticket_id, comment, data)
+                print "Queued update to ticket %s: %s" % (ticket_id, comment)
             return
-        if not ticket:
-            print "Ticket %s not found" % ticket_id
+        if ticket_ids is None:
+            try:
+                tickets = self.trac.query_tickets(
+                    '&'.join(shlex.split(param_str)))
+            except CallFailed:
+                print >> sys.stderr, "Bad query specified, please see `help queries`"
+                return
+        else:
+            try:
+                tickets = self.trac.get_tickets(ticket_ids)
+            except xmlrpclib.Fault, e:
+                print "Ticket not found: %s" % e.faultString
+                return
+        if not tickets:
+            print "No tickets to edit"
             return
         if changes is None: # Summon the editor
-            orig_data = ticket.get_attrs()
-            orig_data['comment'] = "Your comment here"
-            lines = ['%s=%s\n' % (k, v.rstrip())
-                     for k, v in orig_data.iteritems()]
-            data = self._edit_ticket(lines)
-            if data is None:
+            updates = self._edit_tickets(tickets)
+            if updates is None:
                 return False
-            # submit the difference between what went into the editor
-            # and what came out
-            for k, v in orig_data.iteritems():
-                if v in data[k]:
-                    del(data[k])
         else: # just do the update
             data = self._parse_query_str(changes)
-        if 'comment' in data:
-            comment = data.pop('comment')
-        else:
-            comment = ''
-        for k, v in data.iteritems():
-            setattr(ticket, k, v)
-        self.trac.save_ticket(ticket, comment)
-        print "Updated ticket %s: %s" % (ticket.id, comment)
+            comment = data.pop('comment', '')
+            updates = []
+            for ticket in tickets:
+                for k, v in data.iteritems():
+                    setattr(ticket, k, v)
+                updates.append((ticket, comment))
+        if not updates:
+            print "No changes made"
+            return
+        if self.write_queue is not None:
+            try:
+                self.trac.validate_batch([ticket.get_changes()
+                                          for ticket, comment in updates],
+                                         [ticket.id
+                                          for ticket, comment in updates])
+            except ValidationError, e:
+                print e
+                return False
+            for ticket, comment in updates:
+                self.write_queue.enqueue_update(ticket.id, comment,
+                                                ticket.get_changes(),
+                                                ticket.modified)
+                print "Queued update to ticket %s: %s" % (ticket.id, comment)
+            return
+        try:
+            failed = dict(self.trac.save_tickets(updates))
+        except ValidationError, e:
+            print e
+            return False
+        for ticket, comment in updates:
+            if ticket.id in failed:
+                print "Couldn't update ticket %s: %s" % (ticket.id,
+                                                        failed[ticket.id])
+            else:
+                print "Updated ticket %s: %s" % (ticket.id, comment)
+
+    @shell_command('ticket.create')
+    def do_import(self, param_str):
+        """
+        Create tickets from the rows of a CSV or YAML file
+
+        trac->> import `file` [jobs=N]
+
+        Each row holds the fields of a ticket and needs at least a
+        `summary`. All rows are validated before any ticket is created.
+        The id of each new ticket is written to `file`.ids next to its
+        row number, and rows listed there are skipped, so an
+        interrupted import can simply be run again.
+
+        Arguments:
+        - `file`: a .csv file with a header line, or a .yaml/.yml file
+        - `jobs`: the number of requests sent at once, limited by the
+                  site's `max_concurrency`
+        """
+        args = shlex.split(param_str)
+        if not args:
+            print "Try `help import` for more info"
+            return
+        filename = args[0]
+        try:
+            options = dict([arg.split('=') for arg in args[1:]])
+            jobs = int(options.get('jobs', 1))
+        except ValueError:
+            print "Try `help import` for more info"
+            return
+        id_map_file = filename + '.ids'
+        done = importer.load_id_map(id_map_file)
+        tickets = []
+        try:
+            for row_number, row in enumerate(importer.read_rows(filename), 1):
+                if row_number in done:
+                    continue
+                if not row.get('summary'):
+                    print "Row %d has no summary" % row_number
+                    return False
+                summary = row.pop('summary')
+                description = row.pop('description', '')
+                tickets.append((row_number, summary, description, row))
+        except Exception, e:
+            print "Couldn't read %s: %s" % (filename, e)
+            return False
+        if not tickets:
+            print "Nothing to import"
+            return
+        # fields Trac doesn't know would be silently dropped; the
+        # legacy schema only lists the select fields, so it can't tell
+        if 'ticket.getTicketFields' in self.trac.methods:
+            known = set([field['name'] for field in self.trac.ticket_fields])
+            unknown = set()
+            for ticket in tickets:
+                unknown.update([k for k in ticket[3] if k not in known])
+            if unknown:
+                print "Unknown field(s): %s" % ', '.join(sorted(unknown))
+                return False
+        try:
+            self.trac.validate_batch([ticket[3] for ticket in tickets],
+                                     [ticket[0] for ticket in tickets])
+        except ValidationError, e:
+            print e
+            return False
+        id_map = open(id_map_file, 'a')
+
+        def created(row_number, ticket_id):
+            id_map.write("%d\t%d\n" % (row_number, ticket_id))
+            id_map.flush()
+
+        try:
+            failed = self.trac.create_tickets(tickets, jobs, created)
+        except Exception, e:
+            print "Import stopped: %s" % e
+            print "The ids of the tickets created so far are in %s, " \
+                  "run the import again to continue" % id_map_file
+            return False
+        finally:
+            id_map.close()
+        print "Created %d ticket(s), ids are in %s" % (
+            len(tickets) - len(failed), id_map_file)
+        for row_number, error in sorted(failed):
+            print "Row %d failed: %s" % (row_number, error)
+        if failed:
+            print "Run the import again to retry the failed rows"
+
+    def do_queue(self, param_str):
+        """
+        List the queued edits and new tickets
+
+        trac->> queue [clear]
+
+        `queue clear` forgets the operations that were rejected by
+        the server.
+        """
+        if self.write_queue is None:
+            print "The write queue is not enabled."
+            return
+        if param_str.strip() == 'clear':
+            self.write_queue.clear_rejected()
+            print "Cleared rejected operations"
+            return
+        output = ["%d pending operation(s):" % len(self.write_queue)]
+        for op in self.write_queue.pending:
+            output.append(self._format_queued_op(op))
+        if self.write_queue.rejected:
+            output.append("%d rejected operation(s):" %
+                          len(self.write_queue.rejected))
+            for op in self.write_queue.rejected:
+                output.append("%s (%s)" % (self._format_queued_op(op),
+                                           op['error']))
+        self._print_output(output)
+
+    def _format_queued_op(self, op):
+        if op['op'] == 'create':
+            return "  create: %s" % op['summary']
+        return "  update #%s: %r" % (op['id'], op['changes'])
+
+    @shell_command('ticket.update')
+    def do_flush(self, param_str):
+        """
+        Submit the queued edits and new tickets to Trac
+        """
+        if self.write_queue is None:
+            print "The write queue is not enabled."
+            return
+        try:
+            done = self.write_queue.flush(self.trac)
+        except Exception, e:
+            print "Couldn't reach Trac, %d operation(s) still queued." % \
+                len(self.write_queue)
+            print "Error: %s" % e
+            return
+        for op, result in done:
+            if op['op'] == 'create':
+                print "Created ticket %s: %s" % (result, op['summary'])
+            else:
+                print "Updated ticket %s: %s" % (op['id'], op['comment'])
+        if self.write_queue.last_error is not None:
+            print "Couldn't reach Trac, %d operation(s) still queued." % \
+                len(self.write_queue)
+            print "Error: %s" % self.write_queue.last_error
+        if self.write_queue.rejected:
+            print "%d operation(s) were rejected, see `queue`" % \
+                len(self.write_queue.rejected)
     
     
+    @shell_command('wiki.getPage')
+    def do_wiki(self, param_str):
+        """
+        View, edit and list wiki pages
+
+        trac->> wiki view `page`
+        trac->> wiki edit `page` [comment]
+        trac->> wiki list
+
+        Pages are cached locally and only downloaded again when a
+        newer version exists on the server.
+        """
+        args = param_str.split(None, 2)
+        if not args or args[0] not in ('view', 'edit', 'list'):
+            print "Try `help wiki` for more info"
+            return
+        if args[0] == 'list':
+            try:
+                self.trac.sync_wiki_cache()
+                self._print_output(self.trac.list_wiki_pages())
+            except CallFailed, e:
+                print e
+            return
+        if len(args) < 2:
+            print "Please specify a page name"
+            return
+        name = args[1]
+        try:
+            text = self.trac.get_wiki_page(name)
+        except CallFailed, e:
+            print "Page %s not found: %s" % (name, e)
+            return
+        if args[0] == 'view':
+            self._print_output(text.splitlines())
+            return
+        comment = args[2] if len(args) > 2 else ''
+        new_text = self._edit_text(text)
+        if new_text is None:
+            return False
+        try:
+            self.trac.put_wiki_page(name, new_text, comment)
+        except CallFailed, e:
+            print "Couldn't save page %s: %s" % (name, e)
+            return False
+        print "Updated page %s: %s" % (name, comment)
+
+    @shell_command('ticket.listAttachments')
+    def do_attachments(self, ticket_id):
+        """
+        List the attachments of a ticket
+
+        Arguments:
+        - `ticket_id`: An integer id of the ticket
+        """
+        try:
+            attachments = self.trac.list_attachments(int(ticket_id))
+        except ValueError:
+            print "Invalid ticket id specified."
+            return
+        except CallFailed, e:
+            print e
+            return
+        if attachments:
+            output = []
+            for filename, description, size, time, author in attachments:
+                output.append("%s (%d bytes) by %s on %s" % (filename, size,
+                                                            author, time))
+                if description:
+                    output.append("    %s" % description)
+            self._print_output(output)
+        else:
+            print "Ticket %s has no attachments" % ticket_id
+
+    @shell_command('ticket.getAttachment')
+    def do_fetch(self, param_str):
+        """
+        Download a ticket attachment
+
+        trac->> fetch `ticket_id` `filename` [destination]
+
+        Arguments:
+        - `ticket_id`: An integer id of the ticket
+        - `filename`: The name of the attachment
+        - `destination`: Where to save it, defaults to `filename`
+        """
+        try:
+            args = shlex.split(param_str)
+            ticket_id = int(args[0])
+            filename = args[1]
+        except (ValueError, IndexError):
+            print "Try `help fetch` for more info"
+            return
+        dest = args[2] if len(args) > 2 else os.path.basename(filename)
+        size = None
+        try:
+            for attachment in self.trac.list_attachments(ticket_id):
+                if attachment[0] == filename:
+                    size = attachment[2]
+        except CallFailed, e:
+            print e
+            return
+        # download next to `dest` and only replace it once complete
+        try:
+            fd, tmp_name = tempfile.mkstemp(
+                prefix='.%s.' % os.path.basename(dest), suffix='.part',
+                dir=os.path.dirname(dest) or '.')
+        except (IOError, OSError), e:
+            print e
+            return
+        fh = os.fdopen(fd, 'wb')
+        written = None
+        try:
+            written = self.trac.fetch_attachment(ticket_id, filename, fh,
+                                                 size, self._print_progress)
+        except (CallFailed, IOError), e:
+            print e
+        finally:
+            fh.close()
+            # don't leave a partial download behind, even on ^C
+            if written is None:
+                os.remove(tmp_name)
+        if written is None:
+            return
+        try:
+            # mkstemp files are private, give it the usual permissions
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp_name, 0666 & ~umask)
+            os.rename(tmp_name, dest)
+        except OSError, e:
+            os.remove(tmp_name)
+            print e
+            return
+        print "\nSaved %s (%d bytes)" % (dest, written)
+
+    @shell_command('ticket.putAttachment')
+    def do_attach(self, param_str):
+        """
+        Upload a file as a ticket attachment
+
+        trac->> attach `ticket_id` `path` [description]
+
+        Arguments:
+        - `ticket_id`: An integer id of the ticket
+        - `path`: The file to attach
+        - `description`: An optional description of the attachment
+        """
+        try:
+            args = shlex.split(param_str)
+            ticket_id = int(args[0])
+            path = args[1]
+        except (ValueError, IndexError):
+            print "Try `help attach` for more info"
+            return
+        description = ' '.join(args[2:])
+        try:
+            fh = open(path, 'rb')
+        except IOError, e:
+            print e
+            return
+        try:
+            size = os.fstat(fh.fileno()).st_size
+            filename = self.trac.attach_file(ticket_id,
+                                             os.path.basename(path),
+                                             fh, size, description,
+                                             progress=self._print_progress)
+        except CallFailed, e:
+            print e
+            return
+        finally:
+            fh.close()
+        print "\nAttached %s to ticket %s" % (filename, ticket_id)
+
     def do_quit(self, _):
         """
         Quit the program
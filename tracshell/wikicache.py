@@ -0,0 +1,117 @@
+import os
+import urllib
+
+import yaml
+
+
+class WikiCache(object):
+    """
+    A local on-disk cache of wiki pages keyed by page name and version.
+
+    The page text is kept in one file per page and an index file
+    records the cached version of each page along with the time of
+    the last change seen on the server.
+    """
+
+    def __init__(self, directory):
+        """
+        Arguments:
+        - `directory`: the directory the cache is stored in, it is
+                       created if needed
+        """
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._index_file = os.path.join(directory, 'index.yaml')
+        self.versions = {}
+        self.last_change = None
+        self._load_index()
+
+    def _load_index(self):
+        try:
+            fh = open(self._index_file)
+        except IOError:
+            return
+        try:
+            index = yaml.safe_load(fh) or {}
+        finally:
+            fh.close()
+        self.versions = index.get('pages', {})
+        self.last_change = index.get('last_change')
+
+    def _save_index(self):
+        tmp_name = self._index_file + '.tmp'
+        fh = open(tmp_name, 'w')
+        try:
+            yaml.safe_dump({'pages': self.versions,
+                            'last_change': self.last_change},
+                           fh, default_flow_style=False)
+        finally:
+            fh.close()
+        os.rename(tmp_name, self._index_file)
+
+    def _page_file(self, name):
+        if isinstance(name, unicode):
+            name = name.encode('utf-8')
+        return os.path.join(self.directory,
+                            urllib.quote(name, '') + '.txt')
+
+    def get(self, name, version):
+        """
+        Returns the cached text of version `version` of page `name`,
+        or None if that version isn't cached.
+        """
+        if self.versions.get(name) != version:
+            return None
+        try:
+            fh = open(self._page_file(name))
+        except IOError:
+            return None
+        try:
+            return fh.read().decode('utf-8')
+        finally:
+            fh.close()
+
+    def put(self, name, version, text, modified=None):
+        """
+        Stores version `version` of page `name`
+
+        Arguments:
+        - `modified`: the modification time of that version as sent by
+                      the server. The first one stored becomes the
+                      starting point of the next sync when none was
+                      seen yet: any later change to a cached page is
+                      more recent.
+        """
+        fh = open(self._page_file(name), 'w')
+        try:
+            fh.write(text.encode('utf-8'))
+        finally:
+            fh.close()
+        self.versions[name] = version
+        if self.last_change is None and modified is not None:
+            self.last_change = str(modified)
+        self._save_index()
+
+    def invalidate(self, name):
+        """ Drops page `name` from the cache """
+        if name in self.versions:
+            del self.versions[name]
+            try:
+                os.remove(self._page_file(name))
+            except OSError:
+                pass
+            self._save_index()
+
+    def seen_change(self, modified):
+        """
+        Records the modification time of a page seen on the server so
+        that the next sync only asks for later changes.
+
+        Arguments:
+        - `modified`: a timestamp string as sent by the server
+        """
+        modified = str(modified)
+        if self.last_change is None or modified > self.last_change:
+            self.last_change = modified
+            self._save_index()
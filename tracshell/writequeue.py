@@ -0,0 +1,176 @@
+import os
+import xmlrpclib as xmlrpc
+
+import yaml
+
+from tracshell.proxy import _request_not_sent, _request_error
+
+
+class WriteQueue(object):
+    """
+    A durable on-disk queue of ticket.create and ticket.update calls.
+
+    Operations are written to disk as soon as they are queued so that
+    edits survive a slow or unreachable server; `flush` submits them
+    later in chunked multicalls.
+    """
+
+    def __init__(self, filename):
+        """
+        Arguments:
+        - `filename`: path of the file the queue is stored in
+        """
+        self.filename = filename
+        self.pending = []
+        self.rejected = []
+        # why the last flush left operations queued
+        self.last_error = None
+        self._load()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def _load(self):
+        try:
+            fh = open(self.filename)
+        except IOError:
+            return
+        try:
+            data = yaml.safe_load(fh) or {}
+        finally:
+            fh.close()
+        self.pending = data.get('pending', [])
+        self.rejected = data.get('rejected', [])
+
+    def _save(self):
+        # write-and-rename so a crash never leaves a truncated queue
+        tmp_name = self.filename + '.tmp'
+        fh = open(tmp_name, 'w')
+        try:
+            yaml.safe_dump({'pending': self.pending,
+                            'rejected': self.rejected},
+                           fh, default_flow_style=False)
+            fh.flush()
+            os.fsync(fh.fileno())
+        finally:
+            fh.close()
+        os.rename(tmp_name, self.filename)
+
+    def enqueue_create(self, summary, description, fields):
+        """ Queue a ticket.create call """
+        self.pending.append({'op': 'create',
+                             'summary': summary,
+                             'description': description,
+                             'fields': fields})
+        self._save()
+
+    def enqueue_update(self, ticket_id, comment, changes, modified=None):
+        """
+        Queue a ticket.update call
+
+        Arguments:
+        - `ticket_id`: id of the ticket to update
+        - `comment`: the change comment
+        - `changes`: a dict of the changed fields
+        - `modified`: the ticket's modification time when it was
+                      edited, used to detect conflicting changes. No
+                      conflict check is done if it is None.
+        """
+        if modified is not None:
+            modified = str(modified)
+        self.pending.append({'op': 'update',
+                             'id': ticket_id,
+                             'comment': comment,
+                             'changes': changes,
+                             'modified': modified})
+        self._save()
+
+    def clear_rejected(self):
+        """ Forget about operations the server refused """
+        self.rejected = []
+        self._save()
+
+    def _find_conflicts(self, trac, ops):
+        """
+        Returns the indexes of the update operations in `ops` whose
+        ticket has been modified on the server since it was edited.
+        """
+        checked = [i for i, op in enumerate(ops)
+                   if op['op'] == 'update' and op['modified'] is not None]
+        results = trac.multicall([('ticket.get', (ops[i]['id'],))
+                                  for i in checked])
+        conflicts = set()
+        for i, data in zip(checked, results):
+            # let the update itself report faults
+            if not isinstance(data, xmlrpc.Fault) and \
+                    str(data[2]) != ops[i]['modified']:
+                conflicts.add(i)
+        return conflicts
+
+    def _submit(self, trac, ops):
+        calls = []
+        for op in ops:
+            if op['op'] == 'create':
+                calls.append(('ticket.create', (op['summary'],
+                                                op['description'],
+                                                op['fields'],
+                                                False)))
+            else:
+                calls.append(('ticket.update', (op['id'],
+                                                op['comment'],
+                                                op['changes'])))
+        return trac.multicall(calls, raise_errors=False, idempotent=False)
+
+    def flush(self, trac, block_size=100):
+        """
+        Submit the queued operations to the server with batched
+        multicalls, saving the queue after each block of `block_size`
+        operations.
+
+        Updates to tickets that changed on the server since they were
+        edited, operations the server refuses and operations whose
+        request failed after it may have reached the server are moved
+        to `self.rejected`. Operations whose request never reached the
+        server stay queued, the flush stops after their block and the
+        error is kept in `self.last_error`. Errors raised while checking
+        for conflicts, before anything is sent, are raised.
+
+        Arguments:
+        - `trac`: a tracshell.proxy.TracProxy
+
+        Returns a list of (operation, result) tuples for the submitted
+        operations; `result` is the new ticket id for creates.
+        """
+        done = []
+        self.last_error = None
+        position = 0
+        while position < len(self.pending):
+            ops = self.pending[position:position + block_size]
+            conflicts = self._find_conflicts(trac, ops)
+            to_submit = [op for i, op in enumerate(ops)
+                         if i not in conflicts]
+            results = self._submit(trac, to_submit)
+            for i in sorted(conflicts):
+                ops[i]['error'] = "Ticket modified on the server"
+                self.rejected.append(ops[i])
+            unsent = []
+            for op, result in zip(to_submit, results):
+                if isinstance(result, xmlrpc.Fault):
+                    op['error'] = "Code %s: %s" % (result.faultCode,
+                                                   result.faultString)
+                    self.rejected.append(op)
+                elif isinstance(result, Exception):
+                    if _request_not_sent(result):
+                        unsent.append(op)
+                        self.last_error = result
+                    else:
+                        # sending it again could apply it twice
+                        op['error'] = _request_error(result)
+                        self.rejected.append(op)
+                else:
+                    done.append((op, result))
+            self.pending[position:position + len(ops)] = unsent
+            self._save()
+            if unsent:
+                break
+        return done